@@ -1,7 +1,11 @@
+import io
 import os
 import streamlit as st
 import geopandas as gpd
+import numpy as np
+import shapely
 import pydeck as pdk
+import pyogrio
 import pandas as pd
 from datetime import datetime
 
@@ -9,6 +13,25 @@ from datetime import datetime
 st.set_page_config(layout="wide")
 os.environ["MAPBOX_API_KEY"] = "pk.eyJ1IjoicGl2ZXMiLCJhIjoiY204bGVweHY5MTFnZDJscXluOTJ1OHI5OCJ9.3BHtAPkRsjGbwgNykec4VA"
 
+# Decimal places kept for map coordinates (~0.1 m)
+COORD_DECIMALS = 6
+
+# Arrow reads need GDAL >= 3.6
+USE_ARROW = pyogrio.__gdal_version__ >= (3, 6, 0)
+
+# Attribute columns read from each upload (point overlays only need geometry)
+PIPE_COLUMNS = ("PipeID", "Material", "Age")
+LEAK_COLUMNS = ("DateRepor",)
+
+# Layer styles
+PIPE_COLOR = [75, 181, 190]  # Qatium blue
+DISCONNECTED_PIPE_COLOR = [150, 150, 150]
+AGE_BANDS = [10, 30]
+AGE_COLORS = np.array([[0, 255, 0], [255, 165, 0], [255, 0, 0]])  # < 10, < 30, older
+ASSET_COLOR = [0, 200, 255]
+LEAK_COLOR = [255, 0, 0]
+VALVE_COLOR = [255, 255, 0]
+
 # State setup
 if "page" not in st.session_state:
     st.session_state.page = "upload"
@@ -36,13 +59,22 @@ def show_upload_page():
     st.button("🚀 Launch Dashboard", on_click=go_to_dashboard)
 
 # --- DATA LOADERS ---
-def load_geojson(file, name=""):
+@st.cache_resource(max_entries=5)
+def read_geojson(data, columns=None):
+    # Keyed on the uploaded bytes; the frame is shared, so callers must not modify it
+    gdf = gpd.read_file(io.BytesIO(data), columns=columns, engine="pyogrio", use_arrow=USE_ARROW)
+    if gdf.crs and gdf.crs.to_string() != "EPSG:4326":
+        gdf = gdf.to_crs("EPSG:4326")
+    return gdf[gdf.geometry.notnull()]
+
+@st.cache_data
+def parse_years(dates):
+    return pd.to_datetime(dates, errors="coerce").dt.year
+
+def load_geojson(file, name="", columns=None):
     if file:
         try:
-            gdf = gpd.read_file(file)
-            if gdf.crs and gdf.crs.to_string() != "EPSG:4326":
-                gdf = gdf.to_crs("EPSG:4326")
-            gdf = gdf[gdf.geometry.notnull()]
+            gdf = read_geojson(file.getvalue(), columns)
             st.sidebar.success(f"{name}: {len(gdf)} features loaded")
             return gdf
         except Exception as e:
@@ -50,27 +82,39 @@ def load_geojson(file, name=""):
     return None
 
 # --- LAYER CREATORS ---
-def create_pipe_layer(gdf, valve_shut_ids=None, highlight_disconnected=False):
+def create_pipe_layer(gdf, valve_shut_ids=None, highlight_disconnected=False, colors=None):
     if gdf is None or gdf.empty:
         return None
+    color = PIPE_COLOR
+    if highlight_disconnected and valve_shut_ids:
+        color = DISCONNECTED_PIPE_COLOR
     features = []
-    for _, row in gdf.iterrows():
-        coords = list(row.geometry.coords)
-        color = [75, 181, 190]  # Default: Qatium blue
-        if highlight_disconnected and valve_shut_ids:
-            color = [150, 150, 150]
-        features.append({
-            "path": coords,
-            "pipe_id": row.get("PipeID", ""),
-            "Material": row.get("Material", ""),
-            "Age": row.get("Age", ""),
-            "color": color
-        })
+    columns = set(gdf.columns)
+    blank = [""] * len(gdf)
+    pipe_ids = gdf["PipeID"].tolist() if "PipeID" in columns else blank
+    materials = gdf["Material"].tolist() if "Material" in columns else blank
+    ages = gdf["Age"].tolist() if "Age" in columns else blank
+    # Split multi-part pipes into single lines; part_index maps each part back to its pipe
+    parts, part_index = shapely.get_parts(gdf.geometry.values, return_index=True)
+    # One GEOS call for every vertex, then split back into per-part paths
+    coords = shapely.get_coordinates(parts).round(COORD_DECIMALS)
+    paths = np.split(coords, np.cumsum(shapely.get_num_coordinates(parts))[:-1])
+    for path, i in zip(paths, part_index.tolist()):
+        feature = {
+            "path": path.tolist(),
+            "pipe_id": pipe_ids[i],
+            "Material": materials[i],
+            "Age": ages[i]
+        }
+        if colors is not None:
+            # Per-pipe colours only when pipes are styled individually
+            feature["color"] = colors[i]
+        features.append(feature)
     return pdk.Layer(
         "PathLayer",
         data=features,
         get_path="path",
-        get_color="color",
+        get_color="color" if colors is not None else color,
         get_width=5,
         pickable=True
     )
@@ -78,15 +122,17 @@ def create_pipe_layer(gdf, valve_shut_ids=None, highlight_disconnected=False):
 def create_point_layer(gdf, color, radius, id_field="ID"):
     if gdf is None or gdf.empty:
         return None
-    gdf["lon"] = gdf.geometry.x
-    gdf["lat"] = gdf.geometry.y
+    points = pd.DataFrame({
+        "lon": gdf.geometry.x.to_numpy().round(COORD_DECIMALS),
+        "lat": gdf.geometry.y.to_numpy().round(COORD_DECIMALS)
+    })
     return pdk.Layer(
         "ScatterplotLayer",
-        data=gdf,
+        data=points,
         get_position='[lon, lat]',
         get_fill_color=color,
         get_radius=radius,
-        pickable=True
+        pickable=False  # Tooltip only describes pipes
     )
 
 # --- PAGE 2: Map Dashboard ---
@@ -102,45 +148,41 @@ def show_dashboard():
         st.session_state.page = "upload"
         st.rerun()
 
-    pipe_gdf = load_geojson(st.session_state.get("pipes_file"), "Pipes")
-    asset_gdf = load_geojson(st.session_state.get("assets_file"), "Assets")
-    leak_gdf = load_geojson(st.session_state.get("leaks_file"), "Leaks")
-    valve_gdf = load_geojson(st.session_state.get("valves_file"), "Valves")
+    pipe_gdf = load_geojson(st.session_state.get("pipes_file"), "Pipes", PIPE_COLUMNS)
+    asset_gdf = load_geojson(st.session_state.get("assets_file"), "Assets", ()) if show_assets else None
+    leak_gdf = load_geojson(st.session_state.get("leaks_file"), "Leaks", LEAK_COLUMNS)
+    valve_gdf = load_geojson(st.session_state.get("valves_file"), "Valves", ()) if show_valves else None
 
     if leak_gdf is not None and "DateRepor" in leak_gdf.columns:
-        leak_gdf["year"] = pd.to_datetime(leak_gdf["DateRepor"], errors="coerce").dt.year
-        years = leak_gdf["year"].dropna().astype(int).unique()
+        leak_years = parse_years(leak_gdf["DateRepor"])
+        years = leak_years.dropna().astype(int).unique()
         if len(years) > 0:
-            min_year = int(min(years))
-            max_year = int(max(years))
+            min_year = int(years.min())
+            max_year = int(years.max())
             year = st.sidebar.slider("🕓 Leak Year", min_year, max_year, max_year)
-            leak_gdf = leak_gdf[leak_gdf["year"] == year]
+            leak_gdf = leak_gdf[leak_years == year]
         else:
             st.sidebar.warning("No valid leak dates found.")
 
+    pipe_colors = None
     if show_criticality and pipe_gdf is not None and "Age" in pipe_gdf.columns:
-        def age_to_color(age):
-            if age < 10: return [0, 255, 0]
-            elif age < 30: return [255, 165, 0]
-            else: return [255, 0, 0]
-        pipe_gdf["color"] = pipe_gdf["Age"].apply(age_to_color)
-    else:
-        pipe_gdf["color"] = [[75, 181, 190]] * len(pipe_gdf)
+        pipe_colors = AGE_COLORS[np.digitize(pipe_gdf["Age"].to_numpy(), AGE_BANDS)].tolist()
 
     center = [51.5, -0.1]
     if pipe_gdf is not None and not pipe_gdf.empty:
-        center = [pipe_gdf.geometry.centroid.y.mean(), pipe_gdf.geometry.centroid.x.mean()]
+        min_lon, min_lat, max_lon, max_lat = pipe_gdf.total_bounds
+        center = [(min_lat + max_lat) / 2, (min_lon + max_lon) / 2]
     view_state = pdk.ViewState(latitude=center[0], longitude=center[1], zoom=13, pitch=45)
 
     layers = []
     if show_pipes and pipe_gdf is not None:
-        layers.append(create_pipe_layer(pipe_gdf))
+        layers.append(create_pipe_layer(pipe_gdf, colors=pipe_colors))
     if show_assets and asset_gdf is not None:
-        layers.append(create_point_layer(asset_gdf, [0, 200, 255], 40, "AssetID"))
+        layers.append(create_point_layer(asset_gdf, ASSET_COLOR, 40, "AssetID"))
     if show_leaks and leak_gdf is not None:
-        layers.append(create_point_layer(leak_gdf, [255, 0, 0], 25, "LeakID"))
+        layers.append(create_point_layer(leak_gdf, LEAK_COLOR, 25, "LeakID"))
     if show_valves and valve_gdf is not None:
-        layers.append(create_point_layer(valve_gdf, [255, 255, 0], 30, "ValveID"))
+        layers.append(create_point_layer(valve_gdf, VALVE_COLOR, 30, "ValveID"))
 
     tooltip = {
         "html": "<b>Pipe:</b> {pipe_id}<br><b>Material:</b> {Material}<br><b>Age:</b> {Age}",